@@ -0,0 +1,221 @@
+from pymongo import UpdateOne, ASCENDING
+from numpy.lib.stride_tricks import sliding_window_view
+import argparse
+import datetime
+import numpy as np
+from consultas_mongo import connect_to_db
+
+# Detección incremental de medidas atípicas.
+#
+# Recorre la serie de cada sensor en lotes del cursor, ordenada por fecha y a
+# partir de la marca de agua guardada en 'marcas_atipicos'. Entre lotes solo
+# se conservan las últimas VENTANA medidas, la racha de valores repetidos y
+# los _id de esa racha, así que la memoria no depende del largo de la serie.
+# Las medidas marcadas se escriben en bloque con activo=False y un código en
+# 'motivo_inactivo'. El resultado no depende del tamaño de lote.
+#
+# La marca de agua es la fecha de la última medida procesada: una medida
+# insertada después con una fecha anterior (una carga atrasada) no se
+# revisa. Para volver a procesar un sensor hay que borrar su documento de
+# 'marcas_atipicos'.
+#
+# Códigos de motivo:
+#   fuera_de_rango  valor físicamente imposible para el tipo de sensor
+#   atipico         |valor - mediana| > UMBRAL_MAD * MAD de la ventana previa
+#   congelado       el mismo valor se repite RACHA_CONGELADO veces seguidas
+
+VENTANA = 24              # Medidas previas usadas para mediana/MAD (2 h a 5 min)
+UMBRAL_MAD = 6.0
+RACHA_CONGELADO = 12      # 1 h sin cambios a 5 min por medida
+COLECCION_MARCAS = "marcas_atipicos"
+
+LIMITES_FISICOS = {
+    "pH": (0.0, 14.0),
+    "EC": (0.0, 20.0),
+    "Temp": (-10.0, 60.0),
+    "Hum": (0.0, 100.0),
+}
+
+
+class EstadoSensor:
+    """
+    Estado que se arrastra entre lotes: cola de la ventana y racha actual.
+    """
+
+    def __init__(self):
+        self.cola = np.empty(0, dtype=np.float64)
+        self.ultimo = np.nan
+        self.racha = 0
+        self.ids_racha = []  # _id válidos de la racha actual mientras no llega a RACHA_CONGELADO
+
+
+def clasificar_lote(valor: np.ndarray, ids: list, estado: EstadoSensor, limites=None):
+    """
+    Devuelve (motivos, retroactivos) para un lote de valores y actualiza el
+    estado para el lote siguiente. motivos es un array (None = medida válida)
+    alineado con 'valor'; retroactivos son los _id de lotes anteriores que
+    pasan a "congelado" porque su racha alcanzó RACHA_CONGELADO en este lote.
+    """
+    n = len(valor)
+    motivos = np.full(n, None, dtype=object)
+    if n == 0:
+        return motivos, []
+
+    fuera = np.zeros(n, dtype=bool)
+    if limites is not None:
+        minimo, maximo = limites
+        with np.errstate(invalid="ignore"):
+            fuera = ~((valor >= minimo) & (valor <= maximo))
+
+    # Rachas de valores idénticos, continuando la del lote anterior. Cuando una
+    # racha llega a RACHA_CONGELADO se marca completa desde su primer punto.
+    indices = np.arange(n)
+    igual = np.r_[valor[0] == estado.ultimo, valor[1:] == valor[:-1]]
+    reinicio = np.maximum.accumulate(np.where(igual, -1, indices))
+    racha = np.where(reinicio >= 0, indices - reinicio + 1, estado.racha + indices + 1)
+    ultimo_de_racha = np.minimum.accumulate(np.where(np.r_[~igual[1:], True], indices, n)[::-1])[::-1]
+    largo = racha[ultimo_de_racha]
+    motivos[largo >= RACHA_CONGELADO] = "congelado"
+    retroactivos = estado.ids_racha if igual[0] and largo[0] >= RACHA_CONGELADO else []
+
+    # Mediana/MAD sobre las VENTANA medidas anteriores a cada punto. Las
+    # ventanas solo descartan los valores fuera de rango, que se deciden punto
+    # a punto: dentro del lote y en la cola del lote anterior se ven los mismos
+    # valores, así que cortar la serie en otro lugar no cambia el resultado.
+    limpio = np.where(fuera, np.nan, valor)
+    extendido = np.r_[estado.cola, limpio]
+    desde = max(VENTANA - len(estado.cola), 0)  # primeros puntos sin historia suficiente
+    if len(extendido) > VENTANA and desde < n:
+        ventanas = sliding_window_view(extendido[:-1], VENTANA)[-(n - desde):]
+        # Ventanas sin ningún valor válido no tienen referencia y se omiten
+        # (nanmedian avisaría "All-NaN slice")
+        con_datos = np.flatnonzero(np.isfinite(ventanas).any(axis=1))
+        if len(con_datos):
+            ventanas = ventanas[con_datos]
+            mediana = np.nanmedian(ventanas, axis=1)
+            mad = 1.4826 * np.nanmedian(np.abs(ventanas - mediana[:, None]), axis=1)
+            actual = valor[desde:][con_datos]
+            with np.errstate(invalid="ignore"):
+                atipico = (mad > 0) & (np.abs(actual - mediana) > UMBRAL_MAD * mad)
+            motivos[desde + con_datos[atipico]] = "atipico"
+
+    motivos[fuera] = "fuera_de_rango"
+
+    # La última racha puede seguir en el lote siguiente: se guardan sus _id
+    # válidos por si llega a RACHA_CONGELADO
+    if racha[-1] < RACHA_CONGELADO:
+        inicio = max(int(reinicio[-1]), 0)
+        previos = estado.ids_racha if reinicio[-1] < 0 else []
+        estado.ids_racha = previos + [ids[i] for i in range(inicio, n) if motivos[i] is None]
+    else:
+        estado.ids_racha = []
+    estado.cola = extendido[-VENTANA:]
+    estado.ultimo = valor[-1]
+    estado.racha = int(racha[-1])
+    return motivos, retroactivos
+
+
+def procesar_sensor(db, sensor_id, tipo: str = None, tam_lote: int = 5000, simular: bool = False):
+    """
+    Procesa las medidas nuevas de un sensor desde su marca de agua. Devuelve
+    (procesadas, marcadas). Solo se leen medidas con fecha posterior a la
+    marca (ver la nota sobre cargas atrasadas al inicio del módulo).
+    """
+    medidas = db["medidas"]
+    marcas = db[COLECCION_MARCAS]
+    marca = marcas.find_one({"_id": sensor_id}) or {}
+    estado = EstadoSensor()
+    if marca.get("cola"):
+        estado.cola = np.array(marca["cola"], dtype=np.float64)
+        estado.ultimo = np.nan if marca.get("ultimo") is None else marca["ultimo"]
+        estado.racha = marca.get("racha", 0)
+        estado.ids_racha = list(marca.get("ids_racha", []))
+
+    filtro = {"sensor_id": sensor_id}
+    if marca.get("fecha") is not None:
+        filtro["fecha"] = {"$gt": marca["fecha"]}
+    cursor = medidas.find(filtro, {"fecha": 1, "valor": 1, "medida": 1}, batch_size=tam_lote).sort("fecha", ASCENDING)
+
+    limites = LIMITES_FISICOS.get(tipo)
+    procesadas = 0
+    marcadas = 0
+    lote = []
+
+    def vaciar():
+        nonlocal procesadas, marcadas
+        valor = np.array(
+            [np.nan if d.get("valor", d.get("medida")) is None else d.get("valor", d.get("medida")) for d in lote],
+            dtype=np.float64,
+        )
+        motivos, retroactivos = clasificar_lote(valor, [d["_id"] for d in lote], estado, limites)
+        operaciones = [
+            UpdateOne({"_id": lote[i]["_id"]}, {"$set": {"activo": False, "motivo_inactivo": motivos[i]}})
+            for i in np.flatnonzero(motivos != None)  # noqa: E711
+        ] + [
+            UpdateOne({"_id": id_}, {"$set": {"activo": False, "motivo_inactivo": "congelado"}})
+            for id_ in retroactivos
+        ]
+        if operaciones and not simular:
+            medidas.bulk_write(operaciones, ordered=False)
+        if not simular:
+            # La marca se guarda después de escribir: si el proceso se corta,
+            # el lote se vuelve a procesar y las escrituras son idempotentes.
+            marcas.replace_one({"_id": sensor_id}, {
+                "fecha": lote[-1]["fecha"],
+                "cola": [None if np.isnan(v) else float(v) for v in estado.cola],
+                "ultimo": None if np.isnan(estado.ultimo) else float(estado.ultimo),
+                "racha": estado.racha,
+                "ids_racha": estado.ids_racha,
+                "actualizado": datetime.datetime.utcnow(),
+            }, upsert=True)
+        procesadas += len(lote)
+        marcadas += len(operaciones)
+        lote.clear()
+
+    for documento in cursor:
+        lote.append(documento)
+        if len(lote) >= tam_lote:
+            vaciar()
+    if lote:
+        vaciar()
+    return procesadas, marcadas
+
+
+def crear_indice_activo(db):
+    """
+    Índice para que las agregaciones filtren {"activo": True} por sensor y
+    rango de fechas sin leer las medidas descartadas.
+    """
+    return db["medidas"].create_index(
+        [("sensor_id", ASCENDING), ("activo", ASCENDING), ("fecha", ASCENDING)],
+        name="sensor_id_activo_fecha",
+    )
+
+
+def procesar_todos(db, tam_lote: int = 5000, simular: bool = False):
+    if not simular:
+        crear_indice_activo(db)
+    tipos = {s["_id"]: s.get("tipo") for s in db.sensores.find({}, {"tipo": 1})}
+    # Sensores con medidas aunque no estén dados de alta en 'sensores'
+    for sensor_id in db["medidas"].distinct("sensor_id"):
+        tipos.setdefault(sensor_id, None)
+
+    for sensor_id, tipo in tipos.items():
+        try:
+            procesadas, marcadas = procesar_sensor(db, sensor_id, tipo, tam_lote, simular)
+            if procesadas:
+                print(f"Sensor {sensor_id} ({tipo}): {procesadas} medidas nuevas, {marcadas} marcadas como inactivas.")
+        except Exception as e:
+            print(f"Error al procesar el sensor {sensor_id}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Marca medidas atípicas, fuera de rango o congeladas")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--lote", type=int, default=5000, help="Medidas por lote del cursor")
+    parser.add_argument("--simular", action="store_true", help="Solo contar, sin escribir")
+    args = parser.parse_args()
+
+    db = connect_to_db(args.uri)
+    if db is not None:
+        procesar_todos(db, args.lote, args.simular)
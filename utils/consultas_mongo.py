@@ -1,14 +1,16 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 import datetime
 from bson import ObjectId
+from perfilado import fase
 
 # Clase para representar una consulta
 class Consulta:
-    def __init__(self, nota: str, coleccion: str, filtro: dict, actualizacion: dict):
+    def __init__(self, nota: str, coleccion: str, filtro: dict, actualizacion: dict, upsert: bool = False):
         self.nota = nota  # Información sobre lo que hace la consulta
         self.coleccion = coleccion  # Nombre de la colección
         self.filtro = filtro  # Filtro para seleccionar documentos
         self.actualizacion = actualizacion  # Instrucción de actualización
+        self.upsert = upsert  # Insertar si ningún documento coincide con el filtro
 
     def ejecutar(self, coleccion):
         """
@@ -16,17 +18,18 @@ class Consulta:
         """
         try:
             print(f"Ejecutando consulta: {self.nota}")
-            resultado = coleccion.update_many(self.filtro, self.actualizacion)
-            print(f"Resultado: {resultado.modified_count} documentos modificados.\n")
+            resultado = coleccion.update_many(self.filtro, self.actualizacion, upsert=self.upsert)
+            insertados = 1 if resultado.upserted_id is not None else 0
+            print(f"Resultado: {resultado.modified_count} documentos modificados, {insertados} insertados.\n")
         except Exception as e:
             print(f"Error al ejecutar la consulta: {e}")
 
 
 # Conexión a la base de datos
-def connect_to_db():
+def connect_to_db(uri: str = "mongodb://localhost:27017", nombre: str = "hydroedge"):
     try:
-        client = MongoClient("mongodb://localhost:27017")  # Ajusta la URI según tu configuración
-        db = client["hydroedge"]
+        client = MongoClient(uri)  # Ajusta la URI según tu configuración
+        db = client[nombre]
         print("Conexión exitosa a MongoDB")
         return db
     except Exception as e:
@@ -34,6 +37,23 @@ def connect_to_db():
         return None
 
 
+def upsert_lecturas(coleccion, documentos: list, campo_id: str):
+    """
+    Inserta lecturas de forma idempotente: cada documento se identifica por
+    (campo_id, fecha) y solo se escribe si no existe ($setOnInsert), así que
+    volver a ejecutar un seeder no duplica ni falla con DuplicateKeyError.
+    """
+    operaciones = [
+        UpdateOne(
+            {campo_id: doc[campo_id], "fecha": doc["fecha"]},
+            {"$setOnInsert": doc},
+            upsert=True
+        )
+        for doc in documentos
+    ]
+    return coleccion.bulk_write(operaciones, ordered=False)
+
+
 # Consultas
 def consulta_1():
     return [
@@ -215,8 +235,9 @@ def consulta_5():
 
 def consulta_6():
     """
-    Crea (o actualiza por upsert) 3 medidas para cada uno de los 4 actuadores 
-    en la colección 'medidas_actuadores'.
+    Crea (si no existen, por upsert) 3 medidas para cada uno de los 4 actuadores
+    en la colección 'medidas_actuadores'. Las lecturas ya existentes con el
+    mismo (actuador_id, fecha) no se modifican.
     """
     from bson import ObjectId
     from datetime import datetime
@@ -357,15 +378,16 @@ def consulta_6():
             Consulta(
                 nota=f"Crear/upsert doc en 'medidas_actuadores' _id={doc['_id']}",
                 coleccion="medidas_actuadores",
-                filtro={"_id": doc["_id"]},
-                actualizacion={"$set": doc}
+                filtro={"actuador_id": doc["actuador_id"], "fecha": doc["fecha"]},
+                actualizacion={"$setOnInsert": doc},
+                upsert=True
             )
         )
     return consultas
 
-def consulta_7():
+def consulta_7(db):
     """
-    Crea (o actualiza por upsert) 3 medidas para cada uno de los 4 sensores 
+    Crea (si no existen, por upsert) 3 medidas para cada uno de los 4 sensores 
     pertenecientes al cultivo con _id = 678860d7058dfecd98544caa (Sala A).
     """
     from bson import ObjectId
@@ -512,10 +534,10 @@ def consulta_7():
         },
     ]
 
-    # Construimos la lista de consultas de upsert.
+    # Upsert por (sensor_id, fecha): re-ejecutar no duplica ni falla.
     try:
-        db["medidas"].insert_many(documentos)
-        print("Documentos insertados exitosamente.")
+        resultado = upsert_lecturas(db["medidas"], documentos, "sensor_id")
+        print(f"Documentos insertados exitosamente: {resultado.upserted_count} nuevos.")
     except Exception as e:
         print(f"Error al insertar documentos: {e}")
 
@@ -524,8 +546,8 @@ def consulta_8(db):
     Inserta 3 medidas de actuadores para cada uno de los 4 actuadores
     en el cultivo con _id = 678860d7058dfecd98544caa ('Sala A').
 
-    Se usan _id únicos para cada documento.
-    Si alguno de esos _id ya existiera, se lanzará un DuplicateKeyError.
+    Se usan _id únicos para cada documento. Cada lectura se inserta por
+    upsert sobre (actuador_id, fecha), por lo que si ya existe se deja intacta.
     """
 
     # ID del cultivo 'Sala A'
@@ -678,9 +700,9 @@ def consulta_8(db):
 
     # Insertamos todos los documentos de una sola vez
     try:
-        resultado = db["medidas_actuadores"].insert_many(documentos)
+        resultado = upsert_lecturas(db["medidas_actuadores"], documentos, "actuador_id")
         print("¡Documentos de actuadores insertados exitosamente!")
-        print("IDs insertados:", resultado.inserted_ids)
+        print("IDs insertados:", list(resultado.upserted_ids.values()))
     except Exception as e:
         print("Error al insertar documentos de actuadores:", e)
 
@@ -707,8 +729,9 @@ def consulta_9(db):
         "3": "pH-"
     }
 
-    # Leemos todas las recetas
-    recetas = list(db.recetas.find({}))
+    # Leemos todas las recetas (con perfilado.py, cada bloque se mide como fase)
+    with fase("lectura"):
+        recetas = list(db.recetas.find({}))
 
     for receta in recetas:
         etapas = receta.get("etapas", [])
@@ -751,15 +774,16 @@ def consulta_9(db):
             updated_etapas.append(etapa)
 
         # Actualizamos el array de etapas en el documento
-        db.recetas.update_one(
-            {"_id": receta["_id"]},
-            {"$set": {"etapas": updated_etapas}}
-        )
+        with fase("escritura"):
+            db.recetas.update_one(
+                {"_id": receta["_id"]},
+                {"$set": {"etapas": updated_etapas}}
+            )
 
     print("Recetas actualizadas correctamente.")
 
 
 if __name__ == "__main__":
     db = connect_to_db()
-    if db:
+    if db is not None:
         consulta_9(db)
@@ -0,0 +1,288 @@
+from pymongo import MongoClient, ReplaceOne
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import datetime
+import time
+import numpy as np
+
+from series import SensorSeries, ActuatorSeries
+from consultas_mongo import connect_to_db
+
+# Motor de cumplimiento de recetas.
+#
+# Para cada cultivo se carga su receta, se ubican sus etapas en el tiempo a
+# partir de la fecha de inicio del cultivo y se evalúan las medidas de cada
+# etapa contra 'condiciones_ideales' (pH, EC, Temp, Hum) y los ciclos de
+# trabajo de los actuadores contra 'parametros_de_actuadores' (ver
+# consulta_9 para la normalización del campo "tipo"). Todo el cálculo es
+# vectorizado con NumPy sobre SensorSeries/ActuatorSeries, y los cultivos se
+# procesan en paralelo, un proceso por cultivo.
+
+COLECCION_RESUMEN = "cumplimiento_recetas"
+MAX_INCUMPLIMIENTOS = 50  # Intervalos fuera de rango guardados por sensor y etapa
+INTERVALO_NOMINAL_MS = 5 * 60 * 1000  # Una medida cada 5 minutos (ver medidas.py)
+
+
+def _campo(documento: dict, *nombres, defecto=None):
+    # Las recetas se cargaron con distintos nombres de atributos a lo largo del tiempo
+    for nombre in nombres:
+        if documento.get(nombre) is not None:
+            return documento[nombre]
+    return defecto
+
+
+def _items(valor):
+    # condiciones_ideales / parametros_de_actuadores son objetos {"0": {...}} o listas
+    if isinstance(valor, dict):
+        return list(valor.values())
+    return list(valor or [])
+
+
+def ubicar_etapas(receta: dict, fecha_inicio: datetime.datetime):
+    """
+    Devuelve [(indice, etapa, inicio, fin)] encadenando las etapas según su
+    duración en días a partir de la fecha de inicio del cultivo.
+    """
+    etapas = []
+    inicio = fecha_inicio
+    for indice, etapa in enumerate(receta.get("etapas", [])):
+        dias = _campo(etapa, "duracion_dias", "duracion", "dias", defecto=0)
+        fin = inicio + datetime.timedelta(days=float(dias))
+        etapas.append((indice, etapa, inicio, fin))
+        inicio = fin
+    return etapas
+
+
+# --- Cálculo vectorizado ---
+def _pesos(fecha: np.ndarray, fin: np.datetime64):
+    """
+    Tiempo (ms) que representa cada punto: hasta el siguiente punto, acotado
+    a 3 veces el intervalo típico para que un hueco sin datos no cuente como
+    tiempo dentro o fuera de rango. Con un único punto no hay intervalo
+    típico y se usa el nominal.
+    """
+    if len(fecha) == 0:
+        return np.zeros(0, dtype=np.float64)
+    t = fecha.astype("int64")
+    dt = np.diff(t, append=fin.astype("int64"))
+    tipico = np.median(dt[:-1]) if len(dt) > 1 else INTERVALO_NOMINAL_MS
+    dt = np.minimum(dt, 3 * tipico)
+    return np.maximum(dt, 0).astype(np.float64)
+
+
+def _tramos(mascara: np.ndarray):
+    """
+    Índices [inicio, fin) de cada tramo consecutivo de True en la máscara.
+    """
+    borde = np.diff(np.r_[0, mascara.astype(np.int8), 0])
+    return np.flatnonzero(borde == 1), np.flatnonzero(borde == -1)
+
+
+def evaluar_sensor(serie: SensorSeries, minimo: float, maximo: float, fin: datetime.datetime):
+    """
+    Porcentaje del tiempo dentro de [minimo, maximo] e intervalos de
+    incumplimiento de una serie ya recortada a la etapa. Los puntos inactivos
+    (activo=False) se excluyen.
+    """
+    activo = serie.activo
+    fecha = serie.fecha[activo]
+    valor = serie.valor[activo]
+    if len(fecha) == 0:
+        return {"puntos": 0, "porcentaje_en_rango": None, "incumplimientos": 0,
+                "minutos_fuera": 0.0, "promedio": None, "intervalos": []}
+
+    fin64 = np.datetime64(fin, "ms")
+    pesos = _pesos(fecha, fin64)
+    bajo = valor < minimo
+    alto = valor > maximo
+    fuera = bajo | alto
+    total = pesos.sum()
+    en_rango = pesos[~fuera].sum()
+
+    # Tramos por debajo y por encima por separado: un salto directo de bajo a
+    # alto son dos incumplimientos, cada uno con su propio extremo
+    inicios_bajo, fines_bajo = _tramos(bajo)
+    inicios_alto, fines_alto = _tramos(alto)
+    inicios = np.r_[inicios_bajo, inicios_alto]
+    fines = np.r_[fines_bajo, fines_alto]
+    es_bajo = np.r_[np.ones(len(inicios_bajo), dtype=bool), np.zeros(len(inicios_alto), dtype=bool)]
+    # Duración real de cada tramo: suma de pesos de sus puntos
+    acumulado = np.r_[0.0, np.cumsum(pesos)]
+    duraciones = acumulado[fines] - acumulado[inicios]
+    orden = np.argsort(-duraciones, kind="stable")[:MAX_INCUMPLIMIENTOS]
+
+    intervalos = []
+    for k in orden:
+        a, b = inicios[k], fines[k]
+        tramo = valor[a:b]
+        intervalos.append({
+            "inicio": fecha[a].astype(datetime.datetime),
+            "fin": (fecha[a] + np.timedelta64(int(duraciones[k]), "ms")).astype(datetime.datetime),
+            "tipo": "bajo" if es_bajo[k] else "alto",
+            "extremo": float(tramo.min() if es_bajo[k] else tramo.max()),
+            "minutos": float(duraciones[k] / 60000.0),
+        })
+
+    return {
+        "puntos": int(len(fecha)),
+        "porcentaje_en_rango": float(100.0 * en_rango / total) if total else None,
+        "incumplimientos": int(len(inicios)),
+        "minutos_fuera": float((total - en_rango) / 60000.0),
+        "promedio": float(valor.mean()),
+        "intervalos": intervalos,
+    }
+
+
+def ciclo_trabajo(serie: ActuatorSeries, inicio: datetime.datetime, fin: datetime.datetime):
+    """
+    Fracción del tiempo de [inicio, fin) con el actuador encendido. Cada
+    evento fija el estado del actuador hasta el evento siguiente; el estado
+    previo al primer evento de la etapa se toma del último evento anterior.
+    """
+    ini64 = np.datetime64(inicio, "ms").astype("int64")
+    fin64 = np.datetime64(fin, "ms").astype("int64")
+    if fin64 <= ini64 or len(serie) == 0:
+        return None
+    t = serie.fecha.astype("int64")
+    encendido = serie.activo & (np.nan_to_num(serie.valor) > 0)
+
+    # Tramos [t_i, t_{i+1}) recortados a la etapa
+    desde = np.clip(t, ini64, fin64)
+    hasta = np.clip(np.r_[t[1:], fin64], ini64, fin64)
+    encendido_ms = ((hasta - desde) * encendido).sum()
+    # Antes del primer evento no sabemos el estado: ese tramo no se cuenta
+    conocido = fin64 - max(ini64, int(t[0]))
+    if conocido <= 0:
+        return None
+    return float(encendido_ms / conocido)
+
+
+_clientes = {}
+
+
+def evaluar_cultivo(uri: str, cultivo_id):
+    """
+    Evalúa todas las etapas de un cultivo y devuelve la lista de resúmenes.
+    Se ejecuta en un proceso hijo: MongoClient no sobrevive a un fork, así que
+    cada proceso abre el suyo y lo reutiliza entre cultivos.
+    """
+    if uri not in _clientes:
+        _clientes[uri] = MongoClient(uri)
+    db = _clientes[uri]["hydroedge"]
+    cultivo = db.cultivos.find_one({"_id": cultivo_id})
+    receta_id = _campo(cultivo, "receta_id", "receta")
+    fecha_inicio = _campo(cultivo, "fecha_inicio", "fecha_siembra", "fecha")
+    if receta_id is None or fecha_inicio is None:
+        return []
+    if isinstance(fecha_inicio, str):
+        fecha_inicio = datetime.datetime.fromisoformat(fecha_inicio.replace("Z", ""))
+    receta = db.recetas.find_one({"_id": receta_id})
+    if receta is None:
+        return []
+
+    etapas = ubicar_etapas(receta, fecha_inicio)
+    if not etapas:
+        return []
+    inicio_total, fin_total = etapas[0][2], etapas[-1][3]
+
+    # Tipo de cada sensor (colección 'sensores', ver consulta_3)
+    ids_sensores = [s["sensor_id"] for s in cultivo.get("sensores", [])]
+    tipos_sensor = {
+        s["_id"]: s.get("tipo") for s in db.sensores.find({"_id": {"$in": ids_sensores}}, {"tipo": 1})
+    }
+    # Una sola lectura por sensor/actuador para todo el ciclo; las etapas son vistas
+    series_sensores = {
+        tipos_sensor.get(sid): SensorSeries.leer(db, sid, inicio_total, fin_total)
+        for sid in ids_sensores if tipos_sensor.get(sid)
+    }
+    series_actuadores = {}
+    for actuador in cultivo.get("actuadores", []):
+        # Se lee un día antes para conocer el estado al inicio de la primera etapa
+        series_actuadores[actuador.get("tipo")] = ActuatorSeries.leer(
+            db, actuador["actuador_id"], inicio_total - datetime.timedelta(days=1), fin_total
+        )
+
+    resumenes = []
+    for indice, etapa, inicio, fin in etapas:
+        sensores = {}
+        for condicion in _items(etapa.get("condiciones_ideales")):
+            tipo = condicion.get("tipo")
+            minimo = _campo(condicion, "min", "minimo")
+            maximo = _campo(condicion, "max", "maximo")
+            if tipo not in series_sensores or minimo is None or maximo is None:
+                continue
+            resultado = evaluar_sensor(series_sensores[tipo].entre(inicio, fin), float(minimo), float(maximo), fin)
+            resultado.update({"min": float(minimo), "max": float(maximo)})
+            sensores[tipo] = resultado
+
+        actuadores = {}
+        for parametro in _items(etapa.get("parametros_de_actuadores")):
+            tipo = parametro.get("tipo")
+            if tipo not in series_actuadores:
+                continue
+            serie = series_actuadores[tipo]
+            # Incluimos el último evento previo a la etapa para conocer el estado inicial
+            a = max(int(np.searchsorted(serie.fecha, np.datetime64(inicio, "ms"), side="right")) - 1, 0)
+            b = int(np.searchsorted(serie.fecha, np.datetime64(fin, "ms"), side="left"))
+            real = ciclo_trabajo(serie[a:b], inicio, fin)
+            esperado = _campo(parametro, "ciclo_trabajo", "duty_cycle")
+            if esperado is not None and float(esperado) > 1:
+                esperado = float(esperado) / 100.0  # expresado en porcentaje
+            actuadores[tipo] = {
+                "ciclo_trabajo": real,
+                "ciclo_esperado": None if esperado is None else float(esperado),
+                "desviacion": None if real is None or esperado is None else real - float(esperado),
+            }
+
+        resumenes.append({
+            "cultivo_id": cultivo_id,
+            "receta_id": receta_id,
+            "etapa": indice,
+            "nombre_etapa": _campo(etapa, "nombre", "name"),
+            "inicio": inicio,
+            "fin": fin,
+            "sensores": sensores,
+            "actuadores": actuadores,
+            "calculado": datetime.datetime.utcnow(),
+        })
+    return resumenes
+
+
+def evaluar_todos(db, uri: str, procesos: int = None):
+    """
+    Evalúa todos los cultivos en paralelo y guarda un documento por
+    (cultivo_id, etapa) en 'cumplimiento_recetas'.
+    """
+    ids = [c["_id"] for c in db.cultivos.find({}, {"_id": 1})]
+    resumen = db[COLECCION_RESUMEN]
+    resumen.create_index([("cultivo_id", 1), ("etapa", 1)], unique=True)
+
+    inicio = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        tareas = {ejecutor.submit(evaluar_cultivo, uri, cid): cid for cid in ids}
+        for tarea in as_completed(tareas):
+            try:
+                resumenes = tarea.result()
+            except Exception as e:
+                print(f"Error al evaluar el cultivo {tareas[tarea]}: {e}")
+                continue
+            if resumenes:
+                resumen.bulk_write([
+                    ReplaceOne({"cultivo_id": r["cultivo_id"], "etapa": r["etapa"]}, r, upsert=True)
+                    for r in resumenes
+                ], ordered=False)
+                total += len(resumenes)
+
+    print(f"Se evaluaron {len(ids)} cultivos ({total} etapas) en {time.perf_counter() - inicio:.2f} s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evalúa el cumplimiento de las recetas por etapa")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (por defecto, uno por CPU)")
+    args = parser.parse_args()
+
+    db = connect_to_db(args.uri)
+    if db is not None:
+        evaluar_todos(db, args.uri, args.procesos)
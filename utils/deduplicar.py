@@ -0,0 +1,156 @@
+from pymongo import ASCENDING
+import argparse
+import time
+from consultas_mongo import connect_to_db
+
+# Detección y eliminación de lecturas duplicadas.
+#
+# Una lectura se identifica por (sensor_id, fecha) en 'medidas' y por
+# (actuador_id, fecha) en 'medidas_actuadores'. El agrupamiento se hace en el
+# servidor con allowDiskUse para que las colecciones grandes puedan volcar a
+# disco, los sobrantes se borran en lotes con pausa entre lotes para no
+# saturar el servidor, y al final se crea el índice único que impide que
+# vuelvan a aparecer.
+#
+# Solo se borran los grupos cuyos documentos son idénticos en los campos de
+# CAMPOS_CONTENIDO. Si dos lecturas con la misma clave tienen valores
+# distintos no hay forma de saber cuál es la buena: el grupo se informa, no se
+# toca, y el índice único no se crea hasta resolverlo a mano.
+
+COLECCIONES = {
+    "medidas": "sensor_id",
+    "medidas_actuadores": "actuador_id",
+}
+
+# Campos que deben coincidir para considerar idénticos dos documentos con la
+# misma clave. En los actuadores 'activo' es el estado (encendido/apagado).
+CAMPOS_CONTENIDO = {
+    "medidas": ("valor", "medida", "cultivo_id"),
+    "medidas_actuadores": ("valor", "medida", "cultivo_id", "activo"),
+}
+MAX_CONFLICTOS_MOSTRADOS = 20
+
+
+def buscar_duplicados(coleccion, campo_id: str, campos: tuple = ()):
+    """
+    Devuelve un cursor con un documento por grupo duplicado:
+    {"_id": {campo_id, fecha}, "sobrantes": [...], "total": n,
+     "contenidos": [...], "identicos": bool}.
+    Se conserva el documento con menor _id (el más antiguo) y se listan los
+    demás como sobrantes. 'contenidos' son las combinaciones distintas de
+    'campos' dentro del grupo; 'identicos' es True si hay una sola. Los
+    documentos sin 'fecha' (por ejemplo, los que aún usan 'timestamp' porque
+    no pasó consulta_5) no se agrupan: todos caerían en el mismo grupo y se
+    borrarían.
+    """
+    pipeline = [
+        {"$match": {"fecha": {"$exists": True}}},
+        {"$sort": {"_id": ASCENDING}},
+        {"$group": {
+            "_id": {campo_id: f"${campo_id}", "fecha": "$fecha"},
+            "ids": {"$push": "$_id"},
+            "total": {"$sum": 1},
+            "contenidos": {"$addToSet": {campo: f"${campo}" for campo in campos}},
+        }},
+        {"$match": {"total": {"$gt": 1}}},
+        {"$project": {
+            "total": 1,
+            "contenidos": 1,
+            "identicos": {"$eq": [{"$size": "$contenidos"}, 1]},
+            "sobrantes": {"$slice": ["$ids", 1, {"$subtract": ["$total", 1]}]},
+        }},
+    ]
+    return coleccion.aggregate(pipeline, allowDiskUse=True, batchSize=1000)
+
+
+def eliminar_duplicados(coleccion, campo_id: str, campos: tuple = (), tam_lote: int = 1000,
+                        pausa: float = 0.1, simular: bool = False):
+    """
+    Borra los sobrantes de cada grupo duplicado idéntico en lotes de
+    'tam_lote' _id, durmiendo 'pausa' segundos entre lotes. Devuelve
+    (grupos, eliminados, conflictos), donde conflictos es la lista de grupos
+    con valores distintos, que no se borran. Con simular=True solo cuenta,
+    sin borrar.
+    """
+    grupos = 0
+    eliminados = 0
+    conflictos = []
+    lote = []
+
+    def vaciar():
+        nonlocal eliminados
+        if simular:
+            eliminados += len(lote)
+        else:
+            resultado = coleccion.delete_many({"_id": {"$in": lote}})
+            eliminados += resultado.deleted_count
+            if pausa:
+                time.sleep(pausa)
+        lote.clear()
+
+    for grupo in buscar_duplicados(coleccion, campo_id, campos):
+        if not grupo["identicos"]:
+            conflictos.append({"_id": grupo["_id"], "total": grupo["total"], "contenidos": grupo["contenidos"]})
+            continue
+        grupos += 1
+        lote.extend(grupo["sobrantes"])
+        if len(lote) >= tam_lote:
+            vaciar()
+    if lote:
+        vaciar()
+
+    return grupos, eliminados, conflictos
+
+
+def crear_indice_unico(coleccion, campo_id: str):
+    """
+    Crea el índice único (campo_id, fecha). Falla con DuplicateKeyError si aún
+    quedan duplicados, por lo que debe ejecutarse después de la limpieza. Es
+    parcial: los documentos sin 'fecha' quedan fuera, igual que en la búsqueda.
+    """
+    return coleccion.create_index(
+        [(campo_id, ASCENDING), ("fecha", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"fecha": {"$exists": True}},
+        name=f"{campo_id}_fecha_unico",
+    )
+
+
+def deduplicar(db, tam_lote: int = 1000, pausa: float = 0.1, simular: bool = False):
+    for nombre, campo_id in COLECCIONES.items():
+        coleccion = db[nombre]
+        try:
+            print(f"Buscando duplicados en '{nombre}' por ({campo_id}, fecha)...")
+            sin_fecha = coleccion.count_documents({"fecha": {"$exists": False}})
+            if sin_fecha:
+                print(f"  {sin_fecha} documentos sin 'fecha' se omiten (¿falta ejecutar consulta_5?).")
+            grupos, eliminados, conflictos = eliminar_duplicados(
+                coleccion, campo_id, CAMPOS_CONTENIDO.get(nombre, ()), tam_lote, pausa, simular
+            )
+            accion = "a eliminar" if simular else "eliminados"
+            print(f"  {grupos} grupos duplicados idénticos, {eliminados} documentos {accion}.")
+            if conflictos:
+                print(f"  {len(conflictos)} grupos con valores distintos, no se eliminan:")
+                for conflicto in conflictos[:MAX_CONFLICTOS_MOSTRADOS]:
+                    print(f"    {conflicto['_id']} ({conflicto['total']} documentos): {conflicto['contenidos']}")
+                if len(conflictos) > MAX_CONFLICTOS_MOSTRADOS:
+                    print(f"    ... y {len(conflictos) - MAX_CONFLICTOS_MOSTRADOS} más.")
+                print("  El índice único no se crea hasta resolverlos.\n")
+            elif not simular:
+                indice = crear_indice_unico(coleccion, campo_id)
+                print(f"  Índice único '{indice}' creado.\n")
+        except Exception as e:
+            print(f"Error al deduplicar '{nombre}': {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Elimina lecturas duplicadas y crea índices únicos")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--lote", type=int, default=1000, help="Documentos a borrar por lote")
+    parser.add_argument("--pausa", type=float, default=0.1, help="Segundos de espera entre lotes")
+    parser.add_argument("--simular", action="store_true", help="Solo contar duplicados, sin borrar")
+    args = parser.parse_args()
+
+    db = connect_to_db(args.uri)
+    if db is not None:
+        deduplicar(db, args.lote, args.pausa, args.simular)
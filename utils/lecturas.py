@@ -0,0 +1,192 @@
+from collections import OrderedDict
+import datetime
+from consultas_mongo import connect_to_db
+
+# Acceso de lectura a series de 'medidas' y 'medidas_actuadores' con caché.
+#
+# Las series se guardan en caché por (colección, id, inicio de chunk), con
+# chunks de tamaño fijo alineados al epoch. Una consulta que se solapa con
+# otras anteriores solo pide a MongoDB los chunks que faltan (agrupados en
+# rangos contiguos, una consulta por rango) y luego empalma todo. El desalojo
+# es LRU y está limitado por el total de puntos en memoria.
+#
+# La caché no se entera de cambios hechos por otros procesos en chunks ya
+# cerrados: después de ejecutar atipicos.py (que marca activo=False) o de
+# cargar medidas atrasadas hay que llamar a invalidar().
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def remuestrear(puntos: list, inicio: datetime.datetime, resolucion: datetime.timedelta):
+    """
+    Promedia los puntos (fecha, valor, activo) en intervalos de 'resolucion'
+    contados desde 'inicio'. Cada intervalo devuelve (fecha_inicio, promedio,
+    activo), con activo=True si al menos un punto del intervalo lo estaba.
+    Los puntos inactivos no entran en el promedio: un intervalo con solo
+    puntos inactivos devuelve (fecha_inicio, None, False).
+    """
+    resultado = []
+    paso = resolucion.total_seconds()
+    cubeta = None
+    suma = 0.0
+    n = 0
+    inactivos = 0
+    activo = False
+    for fecha, valor, punto_activo in puntos:
+        indice = int((fecha - inicio).total_seconds() // paso)
+        if indice != cubeta:
+            if n or inactivos:
+                resultado.append((inicio + cubeta * resolucion, suma / n if n else None, activo))
+            cubeta, suma, n, inactivos, activo = indice, 0.0, 0, 0, False
+        if not punto_activo:
+            inactivos += 1
+        elif valor is not None:
+            suma += valor
+            n += 1
+        activo = activo or punto_activo
+    if n or inactivos:
+        resultado.append((inicio + cubeta * resolucion, suma / n if n else None, activo))
+    return resultado
+
+
+class LectorSeries:
+    def __init__(self, db, tam_chunk: datetime.timedelta = datetime.timedelta(days=1),
+                 max_puntos: int = 2_000_000):
+        """
+        tam_chunk: granularidad de la caché; max_puntos: total de puntos que
+        se mantienen en memoria antes de desalojar los chunks menos usados.
+        """
+        self.db = db
+        self.tam_chunk = tam_chunk
+        self.max_puntos = max_puntos
+        self._cache = OrderedDict()  # (coleccion, id, chunk) -> [(fecha, valor, activo)]
+        self._puntos = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    # --- Chunks ---
+    def _chunk(self, fecha: datetime.datetime):
+        return int((fecha - EPOCH) // self.tam_chunk)
+
+    def _inicio_chunk(self, chunk: int):
+        return EPOCH + chunk * self.tam_chunk
+
+    @staticmethod
+    def _costo(puntos: list):
+        # Un chunk vacío también ocupa una entrada: cuenta como un punto para
+        # que muchos rangos sin datos terminen desalojándose
+        return max(len(puntos), 1)
+
+    def _guardar(self, clave, puntos: list):
+        anterior = self._cache.pop(clave, None)
+        if anterior is not None:
+            self._puntos -= self._costo(anterior)
+        self._cache[clave] = puntos
+        self._puntos += self._costo(puntos)
+        while self._puntos > self.max_puntos and len(self._cache) > 1:
+            _, desalojado = self._cache.popitem(last=False)
+            self._puntos -= self._costo(desalojado)
+
+    def _consultar(self, coleccion: str, campo_id: str, id_, desde, hasta):
+        cursor = self.db[coleccion].find(
+            {campo_id: id_, "fecha": {"$gte": desde, "$lt": hasta}},
+            {"_id": 0, "fecha": 1, "valor": 1, "medida": 1, "activo": 1},
+        ).sort("fecha", 1)
+        # Algunas medidas antiguas (consulta_7) usan "medida" en lugar de "valor"
+        return [
+            (doc["fecha"], doc.get("valor", doc.get("medida")), doc.get("activo", True))
+            for doc in cursor
+        ]
+
+    def _serie(self, coleccion: str, campo_id: str, id_, inicio, fin, resolucion):
+        primero = self._chunk(inicio)
+        ultimo = self._chunk(fin - datetime.timedelta(microseconds=1))
+        # El chunk que contiene "ahora" puede seguir recibiendo medidas: no se cachea
+        chunk_actual = self._chunk(datetime.datetime.utcnow())
+
+        # Guardamos referencias a los aciertos antes de consultar: al almacenar
+        # los chunks faltantes, el desalojo LRU podría sacarlos de la caché
+        recientes = {}
+        faltantes = []
+        for chunk in range(primero, ultimo + 1):
+            clave = (coleccion, id_, chunk)
+            if clave in self._cache:
+                self._cache.move_to_end(clave)
+                recientes[chunk] = self._cache[clave]
+                self.aciertos += 1
+            else:
+                self.fallos += 1
+                faltantes.append(chunk)
+
+        # Agrupamos los chunks faltantes en rangos contiguos: una consulta por rango
+        i = 0
+        while i < len(faltantes):
+            j = i
+            while j + 1 < len(faltantes) and faltantes[j + 1] == faltantes[j] + 1:
+                j += 1
+            desde = self._inicio_chunk(faltantes[i])
+            hasta = self._inicio_chunk(faltantes[j] + 1)
+            por_chunk = {chunk: [] for chunk in range(faltantes[i], faltantes[j] + 1)}
+            for punto in self._consultar(coleccion, campo_id, id_, desde, hasta):
+                por_chunk[self._chunk(punto[0])].append(punto)
+            for chunk, puntos in por_chunk.items():
+                recientes[chunk] = puntos
+                if chunk < chunk_actual:
+                    self._guardar((coleccion, id_, chunk), puntos)
+            i = j + 1
+
+        # Empalme: los chunks están en orden, solo se recortan los extremos
+        puntos = []
+        for chunk in range(primero, ultimo + 1):
+            datos = recientes[chunk]
+            if chunk == primero or chunk == ultimo:
+                datos = [p for p in datos if inicio <= p[0] < fin]
+            puntos.extend(datos)
+
+        if resolucion is not None:
+            return remuestrear(puntos, inicio, resolucion)
+        return puntos
+
+    # --- API pública ---
+    def get_series(self, sensor_id, start: datetime.datetime, end: datetime.datetime,
+                   resolution: datetime.timedelta = None):
+        """
+        Devuelve las medidas del sensor en [start, end) como lista de
+        (fecha, valor, activo) ordenada por fecha. Con 'resolution' los puntos
+        se promedian en intervalos de ese tamaño.
+        """
+        return self._serie("medidas", "sensor_id", sensor_id, start, end, resolution)
+
+    def get_series_actuador(self, actuador_id, start: datetime.datetime, end: datetime.datetime,
+                            resolution: datetime.timedelta = None):
+        """
+        Igual que get_series, sobre 'medidas_actuadores'.
+        """
+        return self._serie("medidas_actuadores", "actuador_id", actuador_id, start, end, resolution)
+
+    def invalidar(self, id_=None):
+        """
+        Vacía la caché completa, o solo la de un sensor/actuador. Debe
+        llamarse después de ejecutar atipicos.py o de cargar medidas con
+        fechas pasadas: los chunks cacheados no ven esos cambios.
+        """
+        if id_ is None:
+            self._cache.clear()
+            self._puntos = 0
+            return
+        for clave in [c for c in self._cache if c[1] == id_]:
+            self._puntos -= self._costo(self._cache.pop(clave))
+
+
+_lector = None
+
+
+def get_series(sensor_id, start: datetime.datetime, end: datetime.datetime,
+               resolution: datetime.timedelta = None):
+    """
+    Atajo sobre un LectorSeries compartido conectado a la base local.
+    """
+    global _lector
+    if _lector is None:
+        _lector = LectorSeries(connect_to_db())
+    return _lector.get_series(sensor_id, start, end, resolution)
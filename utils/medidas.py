@@ -2,6 +2,7 @@ from pymongo import MongoClient
 import datetime
 import random
 from bson import ObjectId
+from consultas_mongo import upsert_lecturas
 
 # Conexión a la base de datos (ajusta la URI según tu configuración)
 client = MongoClient("mongodb://localhost:27017")
@@ -15,7 +16,9 @@ cultivo_id = ObjectId("678860d7058dfecd98544ca9")
 # Configuración:
 num_medidas = 100                              # Número total de medidas a insertar
 intervalo = datetime.timedelta(minutes=5)      # Intervalo de 5 minutos entre cada medida
-fecha_inicio = datetime.datetime(2025, 1, 28, 12, 0)  # Fecha de inicio (ajusta según lo que necesites)
+# Fecha de inicio: 12:05, porque consulta_7 ya carga para este sensor las
+# lecturas de las 08:00, 10:00 y 12:00 del 28/01 (con otro cultivo_id)
+fecha_inicio = datetime.datetime(2025, 1, 28, 12, 5)
 
 # Creamos una lista para acumular los nuevos documentos
 nuevas_medidas = []
@@ -40,6 +43,8 @@ for i in range(num_medidas):
 
     nuevas_medidas.append(documento)
 
-# Insertamos todas las medidas en la colección usando insert_many
-resultado = medidas_collection.insert_many(nuevas_medidas)
-print(f"Se insertaron {len(resultado.inserted_ids)} documentos en la colección 'medidas'.")
+# Upsert por (sensor_id, fecha) con $setOnInsert: volver a ejecutar el script
+# no duplica medidas ya existentes (ver deduplicar.py y su índice único)
+resultado = upsert_lecturas(medidas_collection, nuevas_medidas, "sensor_id")
+print(f"Se insertaron {resultado.upserted_count} documentos en la colección 'medidas' "
+      f"({len(nuevas_medidas) - resultado.upserted_count} ya existían).")
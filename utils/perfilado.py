@@ -0,0 +1,202 @@
+from pymongo import monitoring
+from collections import defaultdict
+from contextlib import contextmanager
+import argparse
+import cProfile
+import io
+import os
+import pstats
+import runpy
+import sys
+import time
+import tracemalloc
+
+# Modo de perfilado para los scripts de utils/.
+#
+#   python perfilado.py --profile consultas_mongo.py [argumentos del script]
+#
+# Ejecuta el script como __main__ y al terminar informa cuánto tiempo se fue
+# en cada fase:
+#   red             duración de los comandos según el monitoreo de pymongo
+#                   menos la decodificación de las respuestas, que pymongo
+#                   mide dentro del comando (reply.unpack_response)
+#   codificacion    tiempo propio de las funciones de bson (_cbson incluido)
+#                   y de _cmessage medido por cProfile, separado en encode y
+#                   decode de documentos
+#   transformacion  el resto del tiempo: código Python del script
+# además de las fases marcadas explícitamente con fase("nombre") y un archivo
+# .prof (pstats) apto para snakeviz o flameprof.
+#
+# Con --memoria también se activa tracemalloc y se informan el pico de
+# memoria y los mayores asignadores. tracemalloc intercepta cada asignación y
+# hace más lenta la ejecución (sobre todo la transformación), así que los
+# tiempos de esa corrida no son comparables con los de una sin --memoria: el
+# informe indica en qué modo se midió. No se hace una segunda corrida aparte
+# porque los scripts escriben en la base.
+#
+# Sin --profile el script se ejecuta igual, sin ningún costo extra.
+
+_activo = False
+_fases = defaultdict(float)
+
+
+@contextmanager
+def fase(nombre: str):
+    """
+    Marca un bloque del script como fase con nombre. No hace nada si el
+    perfilado no está activo.
+    """
+    if not _activo:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _fases[nombre] += time.perf_counter() - inicio
+
+
+class MonitorComandos(monitoring.CommandListener):
+    """
+    Acumula cantidad y duración de los comandos enviados al servidor.
+    """
+
+    def __init__(self):
+        self.cantidad = defaultdict(int)
+        self.micros = defaultdict(int)
+        self.fallidos = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.cantidad[event.command_name] += 1
+        self.micros[event.command_name] += event.duration_micros
+
+    def failed(self, event):
+        self.fallidos += 1
+        self.cantidad[event.command_name] += 1
+        self.micros[event.command_name] += event.duration_micros
+
+    @property
+    def segundos(self):
+        return sum(self.micros.values()) / 1e6
+
+
+def _tiempo_codificacion(estadisticas: pstats.Stats):
+    """
+    Devuelve (encode, decode): tiempo propio (tottime) de todo lo que vive en
+    el paquete bson, incluidas las extensiones en C que cProfile reporta como
+    builtins de _cbson y _cmessage (armado de mensajes de pymongo).
+    """
+    encode = 0.0
+    decode = 0.0
+    for (archivo, _, funcion), (_, _, tottime, _, _) in estadisticas.stats.items():
+        ruta = archivo.replace("\\", "/")
+        if "/bson/" in ruta or "_cbson" in funcion or "_cmessage" in funcion:
+            if "decode" in funcion or "_to_dict" in funcion or "unpack" in funcion:
+                decode += tottime
+            else:
+                encode += tottime
+    return encode, decode
+
+
+def perfilar(script: str, argumentos: list, salida: str = None, top: int = 15, memoria: bool = False):
+    """
+    Ejecuta 'script' como __main__ con perfilado e imprime el informe. Con
+    memoria=True también mide memoria con tracemalloc, a costa de inflar los
+    tiempos. Devuelve la ruta del archivo .prof generado.
+    """
+    global _activo
+    salida = salida or os.path.splitext(os.path.basename(script))[0] + ".prof"
+
+    # El listener tiene que registrarse antes de que el script cree su MongoClient
+    monitor = MonitorComandos()
+    monitoring.register(monitor)
+
+    sys.argv = [script] + argumentos
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    _activo = True
+    perfil = cProfile.Profile()
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        perfil.enable()
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+    finally:
+        perfil.disable()
+        total = time.perf_counter() - inicio
+        if memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            instantanea = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        _activo = False
+
+    perfil.dump_stats(salida)
+    estadisticas = pstats.Stats(perfil)
+    encode, decode = _tiempo_codificacion(estadisticas)
+    # duration_micros incluye la decodificación de la respuesta: se descuenta
+    # una sola vez para que las fases no se solapen
+    comandos = monitor.segundos
+    red = max(comandos - decode, 0.0)
+    transformacion = max(total - comandos - encode, 0.0)
+
+    print("\n===== Perfilado =====")
+    if memoria:
+        print("Modo: tiempos y memoria (tracemalloc activo: los tiempos están inflados)")
+    else:
+        print("Modo: solo tiempos (sin tracemalloc; usar --memoria para medir memoria)")
+    print(f"Tiempo total:       {total:8.3f} s")
+    print(f"  Red (sin decode): {red:8.3f} s  ({100 * red / total:5.1f} %)")
+    print(f"  Encode BSON:      {encode:8.3f} s  ({100 * encode / total:5.1f} %)")
+    print(f"  Decode BSON:      {decode:8.3f} s  ({100 * decode / total:5.1f} %)")
+    print(f"  Transformación:   {transformacion:8.3f} s  ({100 * transformacion / total:5.1f} %)")
+    if _fases:
+        print("Fases marcadas:")
+        for nombre, segundos in sorted(_fases.items(), key=lambda f: -f[1]):
+            print(f"  {nombre:<18}{segundos:8.3f} s")
+
+    if monitor.cantidad:
+        print(f"Comandos al servidor ({monitor.fallidos} fallidos):")
+        for nombre, cantidad in sorted(monitor.cantidad.items(), key=lambda c: -monitor.micros[c[0]]):
+            print(f"  {nombre:<18}{cantidad:8d} x  {monitor.micros[nombre] / 1e6:8.3f} s")
+
+    if memoria:
+        print(f"Pico de memoria:    {pico / 1024 / 1024:8.2f} MiB")
+        print(f"Mayores asignadores (top {top}):")
+        for estadistica in instantanea.statistics("lineno")[:top]:
+            print(f"  {estadistica}")
+
+    texto = io.StringIO()
+    estadisticas.stream = texto
+    estadisticas.sort_stats("cumulative").print_stats(top)
+    print(texto.getvalue())
+    print(f"Perfil guardado en {salida} (snakeviz {salida} / flameprof {salida} > {salida}.svg)")
+    return salida
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ejecuta un script de utils/ con perfilado opcional")
+    parser.add_argument("--profile", action="store_true", help="Activar cProfile y monitoreo de comandos")
+    parser.add_argument("--memoria", action="store_true",
+                        help="Con --profile, medir también memoria con tracemalloc (infla los tiempos)")
+    parser.add_argument("--salida", default=None, help="Archivo .prof de salida")
+    parser.add_argument("--top", type=int, default=15, help="Cantidad de entradas en los rankings")
+    parser.add_argument("script", help="Script de utils/ a ejecutar")
+    parser.add_argument("argumentos", nargs=argparse.REMAINDER, help="Argumentos del script")
+    args = parser.parse_args()
+
+    # Usamos el módulo importado como 'perfilado' y no este __main__: así el
+    # script perfilado, al hacer 'from perfilado import fase', ve el mismo
+    # estado (_activo, _fases) que perfilar().
+    import perfilado
+
+    if args.profile:
+        perfilado.perfilar(args.script, args.argumentos, args.salida, args.top, args.memoria)
+    else:
+        sys.argv = [args.script] + args.argumentos
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+        runpy.run_path(args.script, run_name="__main__")
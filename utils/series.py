@@ -0,0 +1,249 @@
+import datetime
+import numpy as np
+
+# Representación compacta de series de medidas.
+#
+# En lugar de un dict por lectura (sensor_id, cultivo_id, activo, fecha,
+# notas, ubicacion, valor), una serie guarda:
+#   - fecha como datetime64[ms]      (8 bytes por punto)
+#   - valor como float32             (4 bytes por punto)
+#   - activo como máscara de bits    (1 bit por punto, np.packbits)
+# y los metadatos (ids, ubicación, notas) una sola vez por serie.
+#
+# Los recortes devuelven vistas sobre los mismos buffers: la máscara de bits
+# se comparte con un desplazamiento en bits, sin desempaquetar.
+
+DTYPE_FECHA = "datetime64[ms]"
+DTYPE_VALOR = np.float32
+
+
+class _Serie:
+    campo_id = None
+
+    def __init__(self, id_, fecha, valor, activo_bits=None, n=None, desplazamiento: int = 0,
+                 cultivo_id=None, ubicacion: str = None, notas: str = None):
+        """
+        fecha y valor son arrays de igual longitud; activo_bits es la máscara
+        empaquetada y 'desplazamiento' el bit donde empieza esta serie dentro
+        de ella. Sin máscara, todos los puntos se consideran activos.
+        """
+        self.id = id_
+        self.cultivo_id = cultivo_id
+        self.ubicacion = ubicacion
+        self.notas = notas
+        self.fecha = np.asarray(fecha, dtype=DTYPE_FECHA)
+        self.valor = np.asarray(valor, dtype=DTYPE_VALOR)
+        n = len(self.fecha) if n is None else n
+        if activo_bits is None:
+            activo_bits = np.packbits(np.ones(n, dtype=bool))
+            desplazamiento = 0
+        self._bits = activo_bits
+        self._desplazamiento = desplazamiento
+        self._n = n
+
+    # --- Construcción ---
+    @classmethod
+    def desde_arrays(cls, id_, fecha, valor, activo=None, **metadatos):
+        bits = None if activo is None else np.packbits(np.asarray(activo, dtype=bool))
+        return cls(id_, fecha, valor, bits, len(fecha), 0, **metadatos)
+
+    @classmethod
+    def desde_puntos(cls, id_, puntos: list, **metadatos):
+        """
+        Construye la serie a partir de tuplas (fecha, valor, activo), como las
+        que devuelve lecturas.LectorSeries.
+        """
+        if not puntos:
+            return cls.desde_arrays(id_, [], [], [], **metadatos)
+        fecha, valor, activo = zip(*puntos)
+        valor = [np.nan if v is None else v for v in valor]
+        return cls.desde_arrays(id_, fecha, valor, activo, **metadatos)
+
+    @classmethod
+    def desde_cursor(cls, id_, cursor, tam_lote: int = 10000, **metadatos):
+        """
+        Consume un cursor de documentos con 'fecha', 'valor' y 'activo' en
+        lotes de 'tam_lote': cada lote se convierte a arrays y se descarta, así
+        que nunca hay más de un lote de dicts vivos a la vez. Los metadatos que
+        no se pasen explícitamente se toman del primer documento.
+        """
+        fechas, valores, activos = [], [], []
+        partes = []
+        primero = None
+
+        def cerrar_lote():
+            partes.append((
+                np.array(fechas, dtype=DTYPE_FECHA),
+                np.array(valores, dtype=DTYPE_VALOR),
+                np.array(activos, dtype=bool),
+            ))
+            fechas.clear()
+            valores.clear()
+            activos.clear()
+
+        for doc in cursor:
+            if primero is None:
+                primero = doc
+            fechas.append(doc["fecha"])
+            valor = doc.get("valor", doc.get("medida"))
+            valores.append(np.nan if valor is None else valor)
+            activos.append(doc.get("activo", True))
+            if len(fechas) >= tam_lote:
+                cerrar_lote()
+        if fechas or not partes:
+            cerrar_lote()
+
+        if primero is not None:
+            for campo in ("cultivo_id", "ubicacion", "notas"):
+                metadatos.setdefault(campo, primero.get(campo))
+
+        fecha = np.concatenate([p[0] for p in partes])
+        valor = np.concatenate([p[1] for p in partes])
+        activo = np.concatenate([p[2] for p in partes])
+        return cls.desde_arrays(id_, fecha, valor, activo, **metadatos)
+
+    @classmethod
+    def leer(cls, db, id_, inicio: datetime.datetime, fin: datetime.datetime, tam_lote: int = 10000,
+             solo_activos: bool = False):
+        """
+        Lee de MongoDB las medidas de id_ en [inicio, fin) ordenadas por fecha.
+        Con solo_activos=True se descartan en el servidor las medidas marcadas
+        como inactivas (ver atipicos.py y su índice sensor_id_activo_fecha).
+        """
+        filtro = {cls.campo_id: id_, "fecha": {"$gte": inicio, "$lt": fin}}
+        if solo_activos:
+            filtro["activo"] = True
+        cursor = db[cls.coleccion].find(
+            filtro,
+            {"_id": 0, "fecha": 1, "valor": 1, "medida": 1, "activo": 1,
+             "cultivo_id": 1, "ubicacion": 1, "notas": 1},
+            batch_size=tam_lote,
+        ).sort("fecha", 1)
+        return cls.desde_cursor(id_, cursor, tam_lote)
+
+    def _metadatos(self):
+        return {"cultivo_id": self.cultivo_id, "ubicacion": self.ubicacion, "notas": self.notas}
+
+    # --- Acceso ---
+    def __len__(self):
+        return self._n
+
+    @property
+    def activo(self):
+        """
+        Máscara booleana desempaquetada (se calcula bajo demanda).
+        """
+        inicio = self._desplazamiento
+        return np.unpackbits(self._bits, count=inicio + self._n)[inicio:].astype(bool)
+
+    @property
+    def nbytes(self):
+        """
+        Memoria ocupada por los buffers de esta serie.
+        """
+        return self.fecha.nbytes + self.valor.nbytes + (self._desplazamiento + self._n + 7) // 8
+
+    def __getitem__(self, indice):
+        """
+        Los recortes con paso 1 son vistas sin copia; otros índices (pasos,
+        máscaras, listas) copian.
+        """
+        if isinstance(indice, slice):
+            inicio, fin, paso = indice.indices(self._n)
+            if paso == 1:
+                fin = max(inicio, fin)
+                bit = self._desplazamiento + inicio
+                bits = self._bits[bit // 8:(self._desplazamiento + fin + 7) // 8]
+                return type(self)(self.id, self.fecha[inicio:fin], self.valor[inicio:fin],
+                                  bits, fin - inicio, bit % 8, **self._metadatos())
+        if isinstance(indice, (int, np.integer)):
+            i = int(indice) + self._n if indice < 0 else int(indice)
+            if not 0 <= i < self._n:
+                raise IndexError("Índice fuera de la serie")
+            # Un único bit, sin desempaquetar toda la máscara
+            b = self._desplazamiento + i
+            activo = (self._bits[b >> 3] >> (7 - (b & 7))) & 1
+            return self.fecha[i], self.valor[i], bool(activo)
+        return type(self).desde_arrays(self.id, self.fecha[indice], self.valor[indice],
+                                       self.activo[indice], **self._metadatos())
+
+    def entre(self, inicio: datetime.datetime, fin: datetime.datetime):
+        """
+        Vista de los puntos con fecha en [inicio, fin) (búsqueda binaria).
+        """
+        a = np.searchsorted(self.fecha, np.datetime64(inicio, "ms"), side="left")
+        b = np.searchsorted(self.fecha, np.datetime64(fin, "ms"), side="left")
+        return self[a:b]
+
+    # --- Transformaciones ---
+    def remuestrear(self, resolucion: datetime.timedelta, solo_activos: bool = False):
+        """
+        Promedia los valores en intervalos de 'resolucion' alineados al epoch.
+        Un intervalo queda activo si alguno de sus puntos lo estaba. Con
+        solo_activos=True los puntos inactivos no entran en el promedio.
+        """
+        if self._n == 0:
+            return self[0:0]
+        paso = np.timedelta64(int(resolucion.total_seconds() * 1000), "ms")
+        activo = self.activo
+        valor = self.valor.astype(np.float64)
+        valido = ~np.isnan(valor)
+        if solo_activos:
+            valido &= activo
+        cubetas = self.fecha.astype("int64") // paso.astype("int64")
+        inicios = np.flatnonzero(np.r_[True, cubetas[1:] != cubetas[:-1]])
+        suma = np.add.reduceat(np.where(valido, valor, 0.0), inicios)
+        cuenta = np.add.reduceat(valido.astype(np.int64), inicios)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            promedio = (suma / cuenta).astype(DTYPE_VALOR)
+        fecha = (cubetas[inicios] * paso.astype("int64")).astype(DTYPE_FECHA)
+        return type(self).desde_arrays(self.id, fecha, promedio,
+                                       np.logical_or.reduceat(activo, inicios), **self._metadatos())
+
+    @classmethod
+    def concatenar(cls, series: list):
+        """
+        Une series consecutivas del mismo id. Se reserva el resultado una sola
+        vez y cada parte se copia directamente en su posición.
+        """
+        series = [s for s in series if len(s)]
+        if not series:
+            raise ValueError("No hay series que concatenar")
+        if len({s.id for s in series}) > 1:
+            raise ValueError("Solo se pueden concatenar series del mismo id")
+        if len(series) == 1:
+            return series[0]
+
+        n = sum(len(s) for s in series)
+        fecha = np.empty(n, dtype=DTYPE_FECHA)
+        valor = np.empty(n, dtype=DTYPE_VALOR)
+        activo = np.empty(n, dtype=bool)
+        pos = 0
+        for s in series:
+            fecha[pos:pos + len(s)] = s.fecha
+            valor[pos:pos + len(s)] = s.valor
+            activo[pos:pos + len(s)] = s.activo
+            pos += len(s)
+        return cls.desde_arrays(series[0].id, fecha, valor, activo, **series[0]._metadatos())
+
+    def __repr__(self):
+        rango = f"{self.fecha[0]} .. {self.fecha[-1]}" if self._n else "vacía"
+        return f"{type(self).__name__}({self.campo_id}={self.id}, n={self._n}, {rango})"
+
+
+class SensorSeries(_Serie):
+    coleccion = "medidas"
+    campo_id = "sensor_id"
+
+    @property
+    def sensor_id(self):
+        return self.id
+
+
+class ActuatorSeries(_Serie):
+    coleccion = "medidas_actuadores"
+    campo_id = "actuador_id"
+
+    @property
+    def actuador_id(self):
+        return self.id
@@ -0,0 +1,426 @@
+from pymongo.errors import BulkWriteError
+import argparse
+import datetime
+import heapq
+import json
+import math
+import random
+import time
+from bson import ObjectId
+from consultas_mongo import connect_to_db
+
+# Simulador de carga de invernadero.
+#
+# Modela N cultivos, cada uno con los sensores (pH, EC, Temp, Hum) y los
+# actuadores (flujo, agua, pH+, pH-) definidos en consulta_2. Los eventos se
+# ordenan en un heap por fecha de evento (tiempo simulado) y se emiten a ritmo
+# real, acelerado, o tan rápido como sea posible, hacia MongoDB o hacia un
+# broker MQTT (o un sustituto en memoria).
+
+# IDs de consulta_2. Con --ids-base el primer cultivo simulado reutiliza estos
+# ObjectId para que las medidas generadas sean coherentes con la colección
+# 'cultivos'; por defecto todos los cultivos usan ids nuevos para no mezclar
+# lecturas sintéticas con las del cultivo real "Tomates 2025".
+CULTIVO_BASE_ID = ObjectId("678860d7058dfecd98544ca9")
+SENSORES_BASE = {
+    "pH": ObjectId("67889eee058dfecd98544cab"),
+    "Temp": ObjectId("67889eee058dfecd98544cac"),
+    "EC": ObjectId("67889eee058dfecd98544cad"),
+    "Hum": ObjectId("6788a290058dfecd98544cae"),
+}
+ACTUADORES_BASE = {
+    "flujo": ObjectId("67935081f5d88de05c544cab"),
+    "agua": ObjectId("67935081f5d88de05c544cac"),
+    "pH+": ObjectId("67935081f5d88de05c544cad"),
+    "pH-": ObjectId("67935081f5d88de05c544cae"),
+}
+
+TIPOS_SENSOR = ("pH", "EC", "Temp", "Hum")
+TIPOS_ACTUADOR = ("flujo", "agua", "pH+", "pH-")
+
+# Rangos de control (equivalentes a condiciones_ideales de una receta)
+LIMITES = {
+    "pH": (5.5, 6.5),
+    "EC": (1.2, 2.0),
+    "Temp": (18.0, 28.0),
+    "Hum": (50.0, 80.0),
+}
+
+# Tipos de evento del scheduler
+EVENTO_SENSOR = 0
+EVENTO_RIEGO = 1
+
+
+class Cultivo:
+    """
+    Estado físico de un cultivo simulado: valores actuales de cada sensor y
+    estado (encendido/valor) de cada actuador.
+    """
+
+    def __init__(self, indice: int, ubicacion: str, rng: random.Random, ids_base: bool = False):
+        self.indice = indice
+        self.ubicacion = ubicacion
+        self.rng = rng
+
+        if ids_base and indice == 0:
+            self.cultivo_id = CULTIVO_BASE_ID
+            self.sensores = dict(SENSORES_BASE)
+            self.actuadores = dict(ACTUADORES_BASE)
+        else:
+            self.cultivo_id = ObjectId()
+            self.sensores = {tipo: ObjectId() for tipo in TIPOS_SENSOR}
+            self.actuadores = {tipo: ObjectId() for tipo in TIPOS_ACTUADOR}
+
+        # Valores iniciales con algo de dispersión entre cultivos
+        self.valores = {
+            "pH": rng.uniform(5.8, 6.2),
+            "EC": rng.uniform(1.4, 1.8),
+            "Temp": rng.uniform(20.0, 24.0),
+            "Hum": rng.uniform(55.0, 70.0),
+        }
+        self.encendido = {tipo: False for tipo in TIPOS_ACTUADOR}
+        self.potencia = {tipo: 0 for tipo in TIPOS_ACTUADOR}
+
+    def avanzar(self, tipo: str, fecha: datetime.datetime, dt_min: float):
+        """
+        Avanza el modelo físico del sensor 'tipo' dt_min minutos y devuelve el
+        nuevo valor. Los actuadores encendidos corrigen la deriva natural.
+        """
+        rng = self.rng
+        v = self.valores[tipo]
+
+        if tipo == "pH":
+            # El pH tiende a bajar por la absorción de nutrientes
+            v += -0.004 * dt_min + rng.gauss(0, 0.01)
+            if self.encendido["pH+"]:
+                v += 0.0008 * self.potencia["pH+"] * dt_min
+            if self.encendido["pH-"]:
+                v -= 0.0008 * self.potencia["pH-"] * dt_min
+        elif tipo == "EC":
+            # La EC sube con la evaporación y baja al agregar agua
+            v += 0.002 * dt_min + rng.gauss(0, 0.005)
+            if self.encendido["agua"]:
+                v -= 0.0004 * self.potencia["agua"] * dt_min
+        elif tipo == "Temp":
+            # Ciclo diario: mínimo a las 6h, máximo a las 15h
+            hora = fecha.hour + fecha.minute / 60.0
+            objetivo = 23.0 + 5.0 * math.sin((hora - 9.0) / 24.0 * 2 * math.pi)
+            v += (objetivo - v) * min(1.0, 0.05 * dt_min) + rng.gauss(0, 0.1)
+        elif tipo == "Hum":
+            # La humedad relativa se mueve en sentido opuesto a la temperatura
+            objetivo = 65.0 - 2.5 * (self.valores["Temp"] - 23.0)
+            if self.encendido["flujo"]:
+                objetivo += 5.0
+            v += (objetivo - v) * min(1.0, 0.05 * dt_min) + rng.gauss(0, 0.3)
+            v = max(0.0, min(100.0, v))
+
+        self.valores[tipo] = v
+        return v
+
+    def controlar(self, tipo: str):
+        """
+        Lógica de control sobre la lectura de 'tipo'. Devuelve una lista de
+        (actuador, encendido, potencia) con los cambios de estado producidos.
+        """
+        v = self.valores[tipo]
+        cambios = []
+
+        if tipo == "pH":
+            minimo, maximo = LIMITES["pH"]
+            medio = (minimo + maximo) / 2
+            cambios += self._histeresis("pH+", v < minimo, v >= medio, 30)
+            cambios += self._histeresis("pH-", v > maximo, v <= medio, 30)
+        elif tipo == "EC":
+            minimo, maximo = LIMITES["EC"]
+            cambios += self._histeresis("agua", v > maximo, v <= (minimo + maximo) / 2, 50)
+
+        return cambios
+
+    def _histeresis(self, actuador: str, encender: bool, apagar: bool, potencia: int):
+        if not self.encendido[actuador] and encender:
+            self.encendido[actuador] = True
+            self.potencia[actuador] = potencia
+            return [(actuador, True, potencia)]
+        if self.encendido[actuador] and apagar:
+            self.encendido[actuador] = False
+            self.potencia[actuador] = 0
+            return [(actuador, False, 0)]
+        return []
+
+
+class Scheduler:
+    """
+    Cola de eventos por fecha de evento basada en heapq. Cada entrada es una
+    tupla (t_ms, secuencia, tipo, cultivo, clave) para que la comparación sea
+    siempre entre enteros y el orden sea estable ante empates.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._secuencia = 0
+
+    def programar(self, t_ms: int, tipo: int, cultivo: int, clave: str):
+        self._secuencia += 1
+        heapq.heappush(self._heap, (t_ms, self._secuencia, tipo, cultivo, clave))
+
+    def primero(self):
+        return self._heap[0]
+
+    def siguiente(self):
+        return heapq.heappop(self._heap)
+
+    def reprogramar(self, evento, t_ms: int):
+        # heapreplace evita un pop + push cuando el evento se repite
+        self._secuencia += 1
+        _, _, tipo, cultivo, clave = evento
+        heapq.heapreplace(self._heap, (t_ms, self._secuencia, tipo, cultivo, clave))
+
+    def __len__(self):
+        return len(self._heap)
+
+    def proximo_t(self):
+        return self._heap[0][0]
+
+
+# Sumideros de eventos
+class SumideroMongo:
+    """
+    Acumula documentos y los inserta por lotes con insert_many(ordered=False).
+    Las lecturas que ya existen (índice único de deduplicar.py) se descartan y
+    se cuentan en 'duplicados' en lugar de cortar la simulación.
+    """
+
+    def __init__(self, db, tam_lote: int = 5000):
+        self.medidas = db["medidas"]
+        self.medidas_actuadores = db["medidas_actuadores"]
+        self.tam_lote = tam_lote
+        self._sensores = []
+        self._actuadores = []
+        self.duplicados = 0
+
+    def _insertar(self, coleccion, documentos: list):
+        try:
+            coleccion.insert_many(documentos, ordered=False)
+        except BulkWriteError as e:
+            errores = e.details.get("writeErrors", [])
+            # Con ordered=False el resto del lote se inserta igual; solo
+            # toleramos errores de clave duplicada (11000)
+            if any(error.get("code") != 11000 for error in errores):
+                raise
+            self.duplicados += len(errores)
+
+    # El buffer se reemplaza antes de insertar: si insert_many falla, cerrar()
+    # no vuelve a enviar el mismo lote (que ya tiene _id asignados)
+    def sensor(self, documento: dict):
+        self._sensores.append(documento)
+        if len(self._sensores) >= self.tam_lote:
+            lote, self._sensores = self._sensores, []
+            self._insertar(self.medidas, lote)
+
+    def actuador(self, documento: dict):
+        self._actuadores.append(documento)
+        if len(self._actuadores) >= self.tam_lote:
+            lote, self._actuadores = self._actuadores, []
+            self._insertar(self.medidas_actuadores, lote)
+
+    def cerrar(self):
+        sensores, self._sensores = self._sensores, []
+        actuadores, self._actuadores = self._actuadores, []
+        if sensores:
+            self._insertar(self.medidas, sensores)
+        if actuadores:
+            self._insertar(self.medidas_actuadores, actuadores)
+        if self.duplicados:
+            print(f"Se descartaron {self.duplicados} lecturas que ya existían.")
+
+
+class SumideroMQTT:
+    """
+    Publica cada evento como JSON en el broker MQTT indicado, en los tópicos
+    hydroedge/cultivos/<cultivo_id>/(sensores|actuadores)/<id>. Requiere
+    paho-mqtt.
+    """
+
+    def __init__(self, url: str):
+        import paho.mqtt.client as mqtt
+        from urllib.parse import urlparse
+
+        destino = urlparse(url)
+        self.cliente = mqtt.Client()
+        self.cliente.connect(destino.hostname or "localhost", destino.port or 1883)
+        self.cliente.loop_start()
+
+    @staticmethod
+    def _serializar(documento: dict):
+        return json.dumps(documento, default=str)
+
+    def sensor(self, documento: dict):
+        topico = f"hydroedge/cultivos/{documento['cultivo_id']}/sensores/{documento['sensor_id']}"
+        self.cliente.publish(topico, self._serializar(documento), qos=0)
+
+    def actuador(self, documento: dict):
+        topico = f"hydroedge/cultivos/{documento['cultivo_id']}/actuadores/{documento['actuador_id']}"
+        self.cliente.publish(topico, self._serializar(documento), qos=0)
+
+    def cerrar(self):
+        self.cliente.loop_stop()
+        self.cliente.disconnect()
+
+
+class SumideroMemoria:
+    """
+    Sustituto local del broker: solo cuenta los eventos recibidos. Sirve para
+    medir el rendimiento del propio simulador sin red de por medio.
+    """
+
+    def __init__(self):
+        self.sensores = 0
+        self.actuadores = 0
+
+    def sensor(self, documento: dict):
+        self.sensores += 1
+
+    def actuador(self, documento: dict):
+        self.actuadores += 1
+
+    def cerrar(self):
+        pass
+
+
+class Simulador:
+    def __init__(self, num_cultivos: int, fecha_inicio: datetime.datetime,
+                 intervalo: datetime.timedelta, sumidero, velocidad: float = 0.0,
+                 semilla: int = None, ids_base: bool = False):
+        """
+        velocidad: factor de aceleración respecto al reloj de pared
+        (1.0 = tiempo real, 60.0 = un minuto simulado por segundo).
+        Con 0 los eventos se emiten tan rápido como sea posible.
+        ids_base: el primer cultivo usa los ObjectId reales de consulta_2.
+        """
+        self.rng = random.Random(semilla)
+        self.fecha_inicio = fecha_inicio
+        self.intervalo_ms = int(intervalo.total_seconds() * 1000)
+        self.sumidero = sumidero
+        self.velocidad = velocidad
+        self.scheduler = Scheduler()
+        self.cultivos = [
+            Cultivo(i, f"Invernadero {i + 1}", self.rng, ids_base) for i in range(num_cultivos)
+        ]
+        self.eventos = 0
+
+        # Desfasamos cada sensor dentro del intervalo para no emitir en ráfagas
+        for c in self.cultivos:
+            for tipo in TIPOS_SENSOR:
+                self.scheduler.programar(self.rng.randrange(self.intervalo_ms), EVENTO_SENSOR, c.indice, tipo)
+            # Riego periódico: la bomba de flujo se enciende cada 2 horas
+            self.scheduler.programar(self.rng.randrange(2 * 3600 * 1000), EVENTO_RIEGO, c.indice, "flujo")
+
+    def _fecha(self, t_ms: int):
+        return self.fecha_inicio + datetime.timedelta(milliseconds=t_ms)
+
+    def _emitir_actuador(self, cultivo: Cultivo, actuador: str, encendido: bool,
+                         potencia: int, fecha: datetime.datetime, nota: str):
+        self.sumidero.actuador({
+            "actuador_id": cultivo.actuadores[actuador],
+            "cultivo_id": cultivo.cultivo_id,
+            "fecha": fecha,
+            "activo": encendido,
+            "valor": potencia,
+            "ubicacion": cultivo.ubicacion,
+            "notas": nota,
+        })
+        self.eventos += 1
+
+    def ejecutar(self, duracion: datetime.timedelta):
+        fin_ms = int(duracion.total_seconds() * 1000)
+        intervalo_ms = self.intervalo_ms
+        dt_min = intervalo_ms / 60000.0
+        scheduler = self.scheduler
+        cultivos = self.cultivos
+        sumidero = self.sumidero
+        inicio_pared = time.perf_counter()
+
+        try:
+            while len(scheduler) and scheduler.proximo_t() < fin_ms:
+                evento = scheduler.primero()
+                t_ms, _, tipo_evento, indice, clave = evento
+
+                if self.velocidad > 0:
+                    espera = t_ms / 1000.0 / self.velocidad - (time.perf_counter() - inicio_pared)
+                    if espera > 0:
+                        time.sleep(espera)
+
+                cultivo = cultivos[indice]
+                fecha = self._fecha(t_ms)
+
+                if tipo_evento == EVENTO_SENSOR:
+                    valor = cultivo.avanzar(clave, fecha, dt_min)
+                    sumidero.sensor({
+                        "sensor_id": cultivo.sensores[clave],
+                        "cultivo_id": cultivo.cultivo_id,
+                        "activo": True,
+                        "fecha": fecha,
+                        "notas": f"Medida simulada de {clave}",
+                        "ubicacion": cultivo.ubicacion,
+                        "valor": round(valor, 2),
+                    })
+                    self.eventos += 1
+                    for actuador, encendido, potencia in cultivo.controlar(clave):
+                        nota = f"{actuador} {'encendido' if encendido else 'apagado'} por {clave}={valor:.2f}"
+                        self._emitir_actuador(cultivo, actuador, encendido, potencia, fecha, nota)
+                    scheduler.reprogramar(evento, t_ms + intervalo_ms)
+
+                elif tipo_evento == EVENTO_RIEGO:
+                    encender = not cultivo.encendido["flujo"]
+                    cultivo.encendido["flujo"] = encender
+                    cultivo.potencia["flujo"] = 60 if encender else 0
+                    nota = "Inicio de riego" if encender else "Fin de riego"
+                    self._emitir_actuador(cultivo, "flujo", encender, cultivo.potencia["flujo"], fecha, nota)
+                    # 15 minutos de riego, luego 1h45 de pausa
+                    siguiente = 15 * 60 * 1000 if encender else 105 * 60 * 1000
+                    scheduler.reprogramar(evento, t_ms + siguiente)
+        finally:
+            # Aunque falle una escritura, se vacían los lotes pendientes
+            sumidero.cerrar()
+        return time.perf_counter() - inicio_pared
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador de carga de invernaderos hydroedge")
+    parser.add_argument("--cultivos", type=int, default=10, help="Número de cultivos a simular")
+    parser.add_argument("--horas", type=float, default=24, help="Duración simulada en horas")
+    parser.add_argument("--intervalo", type=float, default=5, help="Minutos entre lecturas de cada sensor")
+    parser.add_argument("--velocidad", type=float, default=0,
+                        help="Factor de aceleración (1 = tiempo real, 0 = sin pausa)")
+    parser.add_argument("--inicio", default="2025-01-28T00:00:00", help="Fecha de inicio (ISO 8601)")
+    parser.add_argument("--destino", choices=["mongo", "mqtt", "memoria"], default="memoria")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--mqtt", default="mqtt://localhost:1883")
+    parser.add_argument("--lote", type=int, default=5000, help="Tamaño de lote para insert_many")
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--ids-base", action="store_true",
+                        help="El primer cultivo usa los sensores/actuadores reales de 'Tomates 2025'")
+    args = parser.parse_args()
+
+    if args.destino == "mongo":
+        db = connect_to_db(args.uri)
+        if db is None:
+            raise SystemExit(1)
+        sumidero = SumideroMongo(db, args.lote)
+    elif args.destino == "mqtt":
+        sumidero = SumideroMQTT(args.mqtt)
+    else:
+        sumidero = SumideroMemoria()
+
+    simulador = Simulador(
+        num_cultivos=args.cultivos,
+        fecha_inicio=datetime.datetime.fromisoformat(args.inicio),
+        intervalo=datetime.timedelta(minutes=args.intervalo),
+        sumidero=sumidero,
+        velocidad=args.velocidad,
+        semilla=args.semilla,
+        ids_base=args.ids_base,
+    )
+    segundos = simulador.ejecutar(datetime.timedelta(hours=args.horas))
+    tasa = simulador.eventos / segundos if segundos > 0 else float("inf")
+    print(f"Se emitieron {simulador.eventos} eventos en {segundos:.2f} s ({tasa:,.0f} eventos/s).")
@@ -0,0 +1,179 @@
+from pymongo import IndexModel
+from bson import json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import json
+import os
+import struct
+import time
+import zstandard
+from consultas_mongo import connect_to_db
+
+# Snapshots de la base 'hydroedge' para aprovisionar entornos de desarrollo/CI.
+#
+# 'volcar' escribe cada colección como un flujo BSON comprimido con zstd
+# (<coleccion>.bson.zst), sus índices (<coleccion>.indices.json) y un
+# manifest.json con los conteos. 'restaurar' carga cada colección en un hilo
+# propio con insert_many desordenados de lotes grandes, crea los índices al
+# final (más barato que mantenerlos durante la carga) y verifica los conteos.
+#
+# Los documentos viajan como RawBSONDocument: ni al volcar ni al restaurar se
+# decodifican a dict, los bytes del servidor se escriben y se reenvían tal cual.
+
+COLECCIONES = ["cultivos", "sensores", "actuadores", "recetas", "medidas", "medidas_actuadores"]
+CODEC_RAW = CodecOptions(document_class=RawBSONDocument)
+
+
+def _leer_documentos(flujo):
+    """
+    Itera los documentos BSON crudos de un flujo: cada documento empieza con
+    su longitud total en un int32 little-endian.
+    """
+    while True:
+        cabecera = flujo.read(4)
+        if not cabecera:
+            return
+        if len(cabecera) < 4:
+            raise ValueError("Snapshot truncado: cabecera BSON incompleta")
+        (longitud,) = struct.unpack("<i", cabecera)
+        cuerpo = flujo.read(longitud - 4)
+        if len(cuerpo) < longitud - 4:
+            raise ValueError("Snapshot truncado: documento BSON incompleto")
+        yield RawBSONDocument(cabecera + cuerpo)
+
+
+def volcar_coleccion(db, nombre: str, directorio: str, nivel: int = 3):
+    """
+    Vuelca una colección y sus índices. Devuelve el número de documentos.
+    """
+    coleccion = db.get_collection(nombre, codec_options=CODEC_RAW)
+    ruta = os.path.join(directorio, f"{nombre}.bson.zst")
+    total = 0
+
+    compresor = zstandard.ZstdCompressor(level=nivel, threads=-1)
+    with open(ruta, "wb") as archivo, compresor.stream_writer(archivo) as salida:
+        for documento in coleccion.find({}, batch_size=10000):
+            salida.write(documento.raw)
+            total += 1
+
+    indices = []
+    for nombre_indice, info in db[nombre].index_information().items():
+        if nombre_indice == "_id_":
+            continue
+        opciones = {k: v for k, v in info.items() if k not in ("key", "v", "ns")}
+        indices.append({"nombre": nombre_indice, "clave": info["key"], "opciones": opciones})
+    with open(os.path.join(directorio, f"{nombre}.indices.json"), "w", encoding="utf-8") as archivo:
+        archivo.write(json_util.dumps(indices, indent=2))
+
+    return total
+
+
+def volcar(db, directorio: str, colecciones: list = None, nivel: int = 3):
+    os.makedirs(directorio, exist_ok=True)
+    colecciones = colecciones or [c for c in COLECCIONES if c in db.list_collection_names()]
+    manifest = {"base": db.name, "colecciones": {}}
+
+    for nombre in colecciones:
+        inicio = time.perf_counter()
+        total = volcar_coleccion(db, nombre, directorio, nivel)
+        manifest["colecciones"][nombre] = total
+        print(f"  '{nombre}': {total} documentos en {time.perf_counter() - inicio:.2f} s")
+
+    with open(os.path.join(directorio, "manifest.json"), "w", encoding="utf-8") as archivo:
+        json.dump(manifest, archivo, indent=2)
+    print(f"Snapshot guardado en {directorio}")
+    return manifest
+
+
+def restaurar_coleccion(db, nombre: str, directorio: str, esperado: int,
+                        tam_lote: int = 10000, reemplazar: bool = False):
+    """
+    Restaura una colección desde su snapshot y devuelve (nombre, insertados).
+    Lanza ValueError si la colección destino no está vacía (salvo con
+    reemplazar=True) o si el conteo final no coincide con el manifest.
+    """
+    coleccion = db.get_collection(nombre, codec_options=CODEC_RAW)
+    if reemplazar:
+        coleccion.drop()
+    elif coleccion.estimated_document_count() > 0:
+        raise ValueError(f"La colección '{nombre}' no está vacía (usa --reemplazar)")
+
+    insertados = 0
+    lote = []
+    descompresor = zstandard.ZstdDecompressor()
+    with open(os.path.join(directorio, f"{nombre}.bson.zst"), "rb") as archivo, \
+            descompresor.stream_reader(archivo) as entrada:
+        for documento in _leer_documentos(entrada):
+            lote.append(documento)
+            if len(lote) >= tam_lote:
+                # pymongo no completa inserted_ids para RawBSONDocument: contamos el lote
+                coleccion.insert_many(lote, ordered=False)
+                insertados += len(lote)
+                lote = []
+    if lote:
+        coleccion.insert_many(lote, ordered=False)
+        insertados += len(lote)
+
+    with open(os.path.join(directorio, f"{nombre}.indices.json"), encoding="utf-8") as archivo:
+        indices = json_util.loads(archivo.read())
+    if indices:
+        coleccion.create_indexes([
+            IndexModel([tuple(par) for par in i["clave"]], name=i["nombre"], **i["opciones"])
+            for i in indices
+        ])
+
+    final = coleccion.count_documents({})
+    if final != esperado:
+        raise ValueError(f"'{nombre}': se esperaban {esperado} documentos y hay {final}")
+    return nombre, insertados
+
+
+def restaurar(db, directorio: str, hilos: int = None, tam_lote: int = 10000, reemplazar: bool = False):
+    with open(os.path.join(directorio, "manifest.json"), encoding="utf-8") as archivo:
+        manifest = json.load(archivo)
+    colecciones = manifest["colecciones"]
+    hilos = hilos or len(colecciones)
+
+    inicio = time.perf_counter()
+    errores = 0
+    # Un hilo por colección: pymongo y zstandard liberan el GIL durante la red
+    # y la descompresión, así que las cargas avanzan en paralelo.
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        tareas = {
+            ejecutor.submit(restaurar_coleccion, db, nombre, directorio, esperado, tam_lote, reemplazar): nombre
+            for nombre, esperado in colecciones.items()
+        }
+        for tarea in as_completed(tareas):
+            try:
+                nombre, insertados = tarea.result()
+                print(f"  '{nombre}': {insertados} documentos restaurados y verificados.")
+            except Exception as e:
+                errores += 1
+                print(f"Error al restaurar '{tareas[tarea]}': {e}")
+
+    print(f"Restauración terminada en {time.perf_counter() - inicio:.2f} s con {errores} errores.")
+    return errores == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Volcado y restauración rápida de la base hydroedge")
+    parser.add_argument("accion", choices=["volcar", "restaurar"])
+    parser.add_argument("directorio", help="Directorio del snapshot")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--base", default="hydroedge", help="Base de datos origen/destino")
+    parser.add_argument("--colecciones", nargs="*", help="Colecciones a volcar (por defecto todas las conocidas)")
+    parser.add_argument("--nivel", type=int, default=3, help="Nivel de compresión zstd")
+    parser.add_argument("--hilos", type=int, default=None, help="Hilos de restauración (por defecto uno por colección)")
+    parser.add_argument("--lote", type=int, default=10000, help="Documentos por insert_many")
+    parser.add_argument("--reemplazar", action="store_true", help="Borrar las colecciones destino antes de restaurar")
+    args = parser.parse_args()
+
+    db = connect_to_db(args.uri, args.base)
+    if db is None:
+        raise SystemExit(1)
+    if args.accion == "volcar":
+        volcar(db, args.directorio, args.colecciones, args.nivel)
+    elif not restaurar(db, args.directorio, args.hilos, args.lote, args.reemplazar):
+        raise SystemExit(1)